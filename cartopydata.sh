@@ -1,6 +1,9 @@
 CARTOPY_DIR=/usr/local/cartopy-data
 NE_PHYSICAL=${CARTOPY_DIR}/shapefiles/natural_earth/physical
-mkdir -p ${NE_PHYSICAL}
-wget https://www.naturalearthdata.com/http//www.naturalearthdata.com/download/10m/physical/ne_10m_coastline.zip -P ${CARTOPY_DIR}
-unzip ${CARTOPY_DIR}/ne_10m_coastline.zip -d  ${NE_PHYSICAL}
+NE_CULTURAL=${CARTOPY_DIR}/shapefiles/natural_earth/cultural
+mkdir -p ${NE_PHYSICAL} ${NE_CULTURAL}
+wget https://www.naturalearthdata.com/http//www.naturalearthdata.com/download/110m/physical/ne_110m_coastline.zip -P ${CARTOPY_DIR}
+unzip ${CARTOPY_DIR}/ne_110m_coastline.zip -d  ${NE_PHYSICAL}
+wget https://www.naturalearthdata.com/http//www.naturalearthdata.com/download/110m/cultural/ne_110m_admin_0_boundary_lines_land.zip -P ${CARTOPY_DIR}
+unzip ${CARTOPY_DIR}/ne_110m_admin_0_boundary_lines_land.zip -d  ${NE_CULTURAL}
 rm ${CARTOPY_DIR}/*.zip
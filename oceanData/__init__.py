@@ -1,3 +1,3 @@
 from oceanData.createplots import plot_sst_coordinates, plot_sst_global
-from oceanData.datacollect import get_data, search_params, stream_data, data_cleanup, download_data
+from oceanData.datacollect import get_auth, search_granules, get_data, search_params, stream_data, data_cleanup, download_data, cleaned_granule
 from oceanData.sst import sst
@@ -1,58 +1,163 @@
 import xarray as xr
 import numpy as np
-import matplotlib.pyplot as plt
 import numpy.ma as ma
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import os 
-import cartopy 
+import math
+from functools import lru_cache
 
-plt.switch_backend("Agg")  # To avoid matplotlib error
+# matplotlib and cartopy are imported inside the plot functions, so importing
+# oceanData for searches and downloads does not pay their import cost
+
+# plots are saved as jpg at a lower dpi, which is much faster to encode than png for large figures
+SAVEFIG_KWARGS = {"dpi": 90, "format": "jpg", "pil_kwargs": {"quality": 85, "optimize": False}}
+
+# fixed figure margins of the plot axes, leaving room below for the axis labels and the colorbar
+MARGINS = {"left": 0.05, "right": 0.95, "top": 0.95, "bottom": 0.2}
+
+# position of the horizontal colorbar axes as [left, bottom, width, height] in figure fractions
+COLORBAR_POSITION = [0.05, 0.1, 0.9, 0.03]
+
+
+@lru_cache(maxsize=1)
+def map_features():
+    """
+    Create the cartopy map features once per process at the 110m scale, which is much faster to draw than finer scales
+
+    Returns:
+        coastline and borders cartopy features
+    """
+
+    import cartopy.feature as cfeature
+
+    return (
+        cfeature.COASTLINE.with_scale("110m"),
+        cfeature.BORDERS.with_scale("110m"),
+    )
+
+
+def crop_to_bounding_box(lon, lat, sst, bounding_box):
+    """
+    Crop arrays to the rows and columns that contain points inside the bounding box
+
+    Args:
+        lon (np array): 2-D array of longitudes
+        lat (np array): 2-D array of latitudes
+        sst (np array): 2-D array of sea surface temperatures
+        bounding_box (array): selection of lat/long in format (lower_left_lon, lower_left_lat , upper_right_lon, upper_right_lat)
+
+    Returns:
+        lon, lat, sst arrays cropped to the bounding box
+    """
+
+    lon_min, lat_min, lon_max, lat_max = bounding_box
+    in_box = (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+
+    # keep whole rows and columns so that the arrays remain 2-D grids for plotting
+    rows = np.any(in_box, axis=1)
+    cols = np.any(in_box, axis=0)
+    if not np.any(rows):
+        return lon, lat, sst
+
+    index = np.ix_(rows, cols)
+    return lon[index], lat[index], sst[index]
+
+
+def downsample_to_axes(lon, lat, sst, ax):
+    """
+    Downsample arrays so that the grid is no finer than the axes resolution of the saved figure
+
+    Args:
+        lon (np array): 2-D array of longitudes
+        lat (np array): 2-D array of latitudes
+        sst (np array): 2-D array of sea surface temperatures
+        ax (matplotlib axes): axes the arrays will be plotted on
+
+    Returns:
+        lon, lat, sst arrays with every row_stride-th row and col_stride-th column
+    """
+
+    # size of the axes in pixels at the dpi the figure is saved with
+    width_in, height_in = ax.figure.get_size_inches()
+    position = ax.get_position()
+    dpi = SAVEFIG_KWARGS["dpi"]
+    axes_px = (position.height * height_in * dpi, position.width * width_in * dpi)
+
+    # rows (along track) run vertically and columns (across track) horizontally
+    row_stride = max(1, math.ceil(lat.shape[0] / axes_px[0]))
+    col_stride = max(1, math.ceil(lat.shape[1] / axes_px[1]))
+
+    index = (slice(None, None, row_stride), slice(None, None, col_stride))
+    return lon[index], lat[index], sst[index]
 
 
 def plot_sst_coordinates(ds):
     """
-    Plot sea surface temperature on contour plot
+    Plot sea surface temperature on colour mesh plot
 
     Args:
-        ds(xr object): xr object containing dataset
+        ds(cleaned_granule): cleaned_granule object containing cleaned dataset
 
     Returns:
-        contour plot of sea surface temperature
+        colour mesh plot of sea surface temperature
     """
 
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend("Agg")  # To avoid matplotlib error
+
     # initialise figure
     fig, ax = plt.subplots(figsize=(15, 10))
 
-    # Contour plot with cleaned data
-    contour = plt.contourf(ds["lon_cleaned"], ds["lat_cleaned"], ds["sst_cleaned"])
+    # fixed margins instead of tight_layout, which recomputes every artist extent. The colorbar
+    # axes is reserved below the plot up front, so the axes size used for downsampling is the final one
+    fig.subplots_adjust(**MARGINS)
+    cax = fig.add_axes(COLORBAR_POSITION)
+
+    # pixels finer than the figure resolution are not visible, so skip them
+    lon, lat, sst = downsample_to_axes(ds.lon, ds.lat, ds.sst, ax)
+
+    # Colour mesh plot with cleaned data, rendered directly without computing contour polygons
+    contour = ax.pcolormesh(
+        lon,
+        lat,
+        sst,
+        shading="auto",
+        cmap="viridis",
+    )
 
     # Add colorbar
-    cbar = plt.colorbar(contour, ax=ax, orientation="horizontal")
+    cbar = plt.colorbar(contour, cax=cax, orientation="horizontal")
     cbar.set_label("Sea surface temperature (K)")
 
     # Annotate plot
     plt.ylabel("Latitude")
     plt.xlabel("Longitude")
-    plt.title("Sea surface temperature %s" % ds["time_coverage_start"])
+    plt.title("Sea surface temperature %s" % ds.time_coverage_start)
 
-    fig.tight_layout()
-    plt.savefig(f'Plots/Sea_surface_temperature_local_{ds["time_coverage_start"]}')
-    print(f'Plot saved under : ' + 'Plots/Sea_surface_temperature_local_{ds["time_coverage_start"]}')
+    filename = f'Plots/Sea_surface_temperature_local_{ds.time_coverage_start}.jpg'
+    plt.savefig(filename, **SAVEFIG_KWARGS)
+    print(f'Plot saved under : {filename}')
     # plt.show()
+    plt.close(fig)
 
 
 def plot_sst_global(ds):
     """
-    Plot sea surface temperature on contour plot on map of the world
+    Plot sea surface temperature on colour mesh plot on map of the world
 
     Args:
-        ds(xr object): xr object containing dataset
+        ds(cleaned_granule): cleaned_granule object containing cleaned dataset
 
     Returns:
-        contour plot of sea surface temperature on map of the world
+        colour mesh plot of sea surface temperature on map of the world
     """
-    
+
+    import matplotlib.pyplot as plt
+    import cartopy
+    import cartopy.crs as ccrs
+
+    plt.switch_backend("Agg")  # To avoid matplotlib error
+
     # get cartopy to source data from offline sources 
     cartopy.config['data_dir'] = os.getenv('CARTOPY_DIR', cartopy.config.get('data_dir'))
 
@@ -60,32 +165,55 @@ def plot_sst_global(ds):
     fig, ax = plt.subplots(
         figsize=(20, 14), subplot_kw={"projection": ccrs.PlateCarree()}
     )
-    ax.set_global()
+
+    # fixed margins instead of tight_layout, which recomputes extents against the coastline
+    # geometries. The colorbar axes is reserved below the map up front, so the axes size used
+    # for downsampling is the final one
+    fig.subplots_adjust(**MARGINS)
+    cax = fig.add_axes(COLORBAR_POSITION)
+
+    lon, lat, sst = ds.lon, ds.lat, ds.sst
+
+    # restrict the plotted domain to the bounding box if one was given
+    if ds.bounding_box is not None:
+        lon, lat, sst = crop_to_bounding_box(lon, lat, sst, ds.bounding_box)
+        lon_min, lat_min, lon_max, lat_max = ds.bounding_box
+        ax.set_extent([lon_min, lon_max, lat_min, lat_max], crs=ccrs.PlateCarree())
+    else:
+        ax.set_global()
+
+    # pixels finer than the figure resolution are not visible, so skip them
+    lon, lat, sst = downsample_to_axes(lon, lat, sst, ax)
+
+    # Add a raster background image for land and ocean, which is drawn without
+    # clipping and projecting the land and ocean polygons
+    ax.stock_img()
 
     # Add coastline and country borders for context
-    ax.add_feature(cfeature.COASTLINE)
-    ax.add_feature(cfeature.BORDERS, linestyle=":")
-    ax.add_feature(cfeature.LAND, color="lightgray")
-    ax.add_feature(cfeature.OCEAN, color="lightblue")
-
-    # Create a filled contour plot
-    contour = ax.contourf(
-        ds["lon_cleaned"],
-        ds["lat_cleaned"],
-        ds["sst_cleaned"],
-        levels=20,
+    coastline, borders = map_features()
+    ax.add_feature(coastline)
+    ax.add_feature(borders, linestyle=":")
+
+    # Create a colour mesh plot, avoiding cartopy reprojecting each contour path
+    contour = ax.pcolormesh(
+        lon,
+        lat,
+        sst,
+        transform=ccrs.PlateCarree(),
+        shading="auto",
         cmap="viridis",
     )
 
     # Add colorbar
-    cbar = plt.colorbar(contour, ax=ax, orientation="horizontal")
+    cbar = plt.colorbar(contour, cax=cax, orientation="horizontal")
     cbar.set_label("Sea surface temperature (K)")
 
     # Set a title
     plt.title("SST Plot on a Map of the World")
 
-    fig.tight_layout()
     # Show the plot
     # plt.show()
-    plt.savefig(f'Plots/Sea_surface_temperature_global_map_{ds["time_coverage_start"]}')
-    print(f'Plot saved under : ' + 'Plots/Sea_surface_temperature_global_map_{ds["time_coverage_start"]}')
+    filename = f'Plots/Sea_surface_temperature_global_map_{ds.time_coverage_start}.jpg'
+    plt.savefig(filename, **SAVEFIG_KWARGS)
+    print(f'Plot saved under : {filename}')
+    plt.close(fig)
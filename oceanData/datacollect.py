@@ -1,12 +1,63 @@
-import earthaccess
 import xarray as xr
 import sys
 import numpy as np
 import numpy.ma as ma
 import os
+import shutil
+import subprocess
 import requests 
 from requests.auth import HTTPBasicAuth
 from urllib.request import urlretrieve
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+# maximum number of files downloaded at the same time
+MAX_DOWNLOADS = 8
+
+# rechunk downloaded files with nccopy before opening them. This only pays off when the same
+# local files are opened repeatedly, as each granule is otherwise read once, so it is off by default
+RECHUNK = False
+
+# MODIS L2P variables that are used for plotting
+KEEP_VARIABLES = ["lat", "lon", "time", "sea_surface_temperature"]
+
+# MODIS L2P variables that are not used, skipped when opening files to save reading and decoding them
+DROP_VARIABLES = [
+    "sst_dtime",
+    "quality_level",
+    "sses_bias",
+    "sses_standard_deviation",
+    "l2p_flags",
+    "chlorophyll_a",
+    "K_490",
+    "wind_speed",
+    "dt_analysis",
+    "sea_surface_temperature_4um",
+    "quality_level_4um",
+    "sses_bias_4um",
+    "sses_standard_deviation_4um",
+]
+
+
+@dataclass(slots=True)
+class cleaned_granule:
+    """
+    Class to hold the cleaned arrays of a granule that are passed to the plot functions.
+
+    Args:
+        lon (np array): 2-D float32 array of longitudes
+        lat (np array): 2-D float32 array of latitudes
+        sst (np array): 2-D float32 array of sea surface temperatures, NaN where missing
+        time_coverage_start (str): start time of the granule
+        bounding_box (array): optional selection of lat/long in format (lower_left_lon, lower_left_lat , upper_right_lon, upper_right_lat) to restrict plots to
+    """
+
+    lon: np.ndarray
+    lat: np.ndarray
+    sst: np.ndarray
+    time_coverage_start: str
+    bounding_box: tuple | None = None
 
 
 class search_params:
@@ -47,6 +98,10 @@ class search_params:
             self.bounding_box = (-45, -45, 45, 45)
             self.plot_type = "local"
 
+        # ISO format start and end times used by the search
+        self.start_iso = f"{self.start_date}T{self.start_time}"
+        self.end_iso = f"{self.end_date}T{self.end_time}"
+
         print("Start date", self.start_date)
         print("End date", self.end_date)
         print("Start time", self.start_time)
@@ -54,6 +109,46 @@ class search_params:
         print("Latitude and longitude selection", self.bounding_box)
 
 
+@lru_cache(maxsize=1)
+def get_auth():
+    """
+    Function to log in to earth access once per process, reusing the session on later calls
+
+    Returns:
+        auth(earthaccess Auth): earth access authentication object
+    """
+
+    import earthaccess
+
+    # persist saves the credentials to the .netrc file if they had to be entered
+    return earthaccess.login(persist=True)
+
+
+@lru_cache(maxsize=32)
+def search_granules(start_iso, end_iso, bounding_box):
+    """
+    Function to search earth access for MODIS granules, caching results so repeated searches do not call the CMR API again
+
+    Args:
+        start_iso (str): time to start search in format YYYY-MM-DDTHH:MM:SS
+        end_iso (str): time to finish search in format YYYY-MM-DDTHH:MM:SS
+        bounding_box (tuple): selection of lat/long in format (lower_left_lon, lower_left_lat , upper_right_lon, upper_right_lat)
+
+    Returns:
+        results(URL) : results from earth access search API
+    """
+
+    import earthaccess
+
+    return earthaccess.search_data(
+        short_name="MODIS_A-JPL-L2P-v2019.0",
+        cloud_hosted=True,
+        temporal=(start_iso, end_iso),
+        bounding_box=bounding_box,
+        count=1,
+    )
+
+
 def get_data(**kwargs):
     """
     Function to search earth access data for MODIS satellite data using search params data
@@ -65,18 +160,17 @@ def get_data(**kwargs):
         results(URL) : results from earth access search API
     """
 
+    # Function call to retrieve credentials using the .netrc file
+    get_auth()
+
     # set default times if not already specified.
     earthAccess_data = search_params(**kwargs)
 
-    results = earthaccess.search_data(
-        short_name="MODIS_A-JPL-L2P-v2019.0",
-        cloud_hosted=True,
-        temporal=(
-            f"{earthAccess_data.start_date}T{earthAccess_data.start_time}",
-            f"{earthAccess_data.end_date}T{earthAccess_data.end_time}",
-        ),
-        bounding_box=earthAccess_data.bounding_box,
-        count=1,
+    # bounding box is passed as a tuple so the search can be cached
+    results = search_granules(
+        earthAccess_data.start_iso,
+        earthAccess_data.end_iso,
+        tuple(earthAccess_data.bounding_box),
     )
 
     if len(results) == 0:
@@ -97,56 +191,185 @@ def stream_data(results):
         ds(xr object): xr object containing dataset
     """
 
+    import earthaccess
+
     fileset = earthaccess.open(results)
 
     print(f" Using {type(fileset[0])} filesystem")
 
     # open dataset streaming object with h5netcdf engine
-    ds = xr.open_mfdataset(fileset, chunks={}, engine="h5netcdf")
+    ds = open_granule(fileset)
 
     return ds
 
 
-def data_cleanup(ds):
+def open_granule(fileset):
     """
-    Function to clean up data by removing NaN values from dataset
+    Function to open the granule that is cleaned and plotted into an xr object using the h5netcdf engine.
+    Swaths of different granules do not share a grid, so only the last file is opened, and a notice is printed if more were given.
 
     Args:
+        fileset(List): file paths or file objects to open
+
+    Returns:
         ds(xr object): xr object containing dataset
+    """
+
+    if len(fileset) > 1:
+        print(f"{len(fileset)} granules found, only the last one is plotted")
+
+    # the granule is opened lazily without building a dask graph
+    ds = xr.open_dataset(fileset[-1], engine="h5netcdf", drop_variables=DROP_VARIABLES)
+
+    return ds
+
+
+def data_cleanup(ds, bounding_box=None):
+    """
+    Function to clean up data by removing NaN values from dataset.
+    Latitude and longitude are loaded in full, while only the valid rows of sea surface temperature are read.
+
+    Args:
+        ds(xr object): xr object containing dataset
+        bounding_box (array): optional selection of lat/long in format (lower_left_lon, lower_left_lat , upper_right_lon, upper_right_lat) to restrict plots to
 
     Returns:
-        ds_cleaned(xr object): xr object containing cleaned dataset
+        ds_cleaned(cleaned_granule): cleaned_granule object containing cleaned float32 arrays
     """
-    # np arrays
-    lat = np.array(ds.lat)
-    lon = np.array(ds.lon)
-    sst = np.array(ds.sea_surface_temperature[0])
+    # Select the single time step of the granule
+    ds = ds.isel(time=0)
 
-    # Remove rows with Nan values.
+    # The bare variables are used as lat and lon are also coordinates of the DataArrays
+    geo = xr.Dataset({"lat": ds.lat.variable, "lon": ds.lon.variable})
+
+    # The mask needs every latitude and longitude value, so both are loaded in full here, in a
+    # single compute (run in dask's thread pool for dask backed data). They are reused for both
+    # the mask and the row selection rather than being read from the file a second time.
+    # Sea surface temperature stays unloaded until its valid rows are selected below
+    geo = geo.compute()
 
-    # Use np.isnan() to create a mask for rows containing NaN values for latitude
-    nan_lat_mask = np.any(np.isnan(lat), axis=1)
+    # cast to float32 once loaded, which does not copy the float32 coordinates MODIS L2P stores
+    lat = geo.lat.values.astype(np.float32, copy=False)
+    lon = geo.lon.values.astype(np.float32, copy=False)
+
+    # Remove rows with Nan values.
 
-    # Use np.isnan() to create a mask for rows containing NaN values for longitude
-    nan_lon_mask = np.any(np.isnan(lon), axis=1)
+    # A row sum is NaN if any value in the row is NaN, so each mask is found in a
+    # single pass without building a full size boolean array
+    nan_lat_mask = np.isnan(lat.sum(axis=1))
+    nan_lon_mask = np.isnan(lon.sum(axis=1))
 
-    # Obtain the combination of these masks to exclude Nan values for both longitude and latitude
-    combined_mask = np.logical_and(nan_lat_mask, nan_lon_mask)
+    # Obtain the combination of these masks to exclude rows with Nan values in either longitude or latitude
+    combined_mask = np.logical_or(nan_lat_mask, nan_lon_mask)
 
     # Use boolean indexing to exclude rows with NaN values for all arrays
     lon_cleaned = lon[~combined_mask]
     lat_cleaned = lat[~combined_mask]
-    sst_cleaned = sst[~combined_mask]
+
+    # Only the rows of sea surface temperature without NaN coordinates are read. The rows are
+    # selected before the float32 cast, as the cast loads the whole variable it is applied to
+    sst = ds.sea_surface_temperature.isel(nj=~combined_mask).astype(np.float32, copy=False)
+
+    # Remaining NaN sea surface temperatures (land, cloud) are kept, as pcolormesh masks them
+    # itself, so no second copy of the array or full size mask is made here
+    sst_cleaned = sst.values
 
     # assign cleaned data to new dataset
-    ds_cleaned = {}
-    ds_cleaned["lon_cleaned"] = lon_cleaned
-    ds_cleaned["lat_cleaned"] = lat_cleaned
-    ds_cleaned["sst_cleaned"] = sst_cleaned
-    ds_cleaned["time_coverage_start"] = ds.time_coverage_start
+    ds_cleaned = cleaned_granule(
+        lon=lon_cleaned,
+        lat=lat_cleaned,
+        sst=sst_cleaned,
+        time_coverage_start=ds.time_coverage_start,
+        bounding_box=bounding_box,
+    )
 
     return ds_cleaned
 
+def download_file(x, username, password):
+    """
+    Function to download a single earth access search result to the local folder using wget
+
+    Args:
+        x: single result from earth access search API
+        username (str): earthdata username from .netrc file
+        password (str): earthdata password from .netrc file
+
+    Returns:
+        filename(str): path to the downloaded file, rechunked if RECHUNK is set
+    """
+
+    str_result = str(x)
+    # get Data url from list
+    url = str_result.split("Data: ")[1][2:-2]
+
+    # get filename from url 
+    output = f"{os.getcwd()}/local_folder" 
+    filename = f"{output}/{url.split('/')[-1]}" 
+
+    # check if file already exists         
+    if(os.path.isfile(filename)!=True):
+        # call wget on bash using python 
+        os.system("wget " + f"-P {output}/" + " --user=" + username + " --password=" + password + " "+ url )
+    else:
+        print('Filename '+ filename + ' already exists') 
+
+    if RECHUNK:
+        return rechunk_file(filename)
+
+    return filename
+
+
+def rechunk_file(filename):
+    """
+    Function to rechunk a downloaded netCDF file with nccopy so that later reads of whole swaths use few large chunks.
+    Only the variables used for plotting are copied, with light compression. The rechunked copy is cached in the
+    rechunked folder next to the download and reused on later calls. Copies are never removed, so the folder keeps
+    growing alongside the downloads in local_folder. Only used when RECHUNK is set, for workflows that reopen local files.
+
+    Args:
+        filename(str): path to the downloaded file
+
+    Returns:
+        filename(str): path to the rechunked file, or the downloaded file if nccopy is not available or fails
+    """
+
+    output = f"{os.path.dirname(filename)}/rechunked"
+    rechunked = f"{output}/{os.path.basename(filename)}"
+
+    if os.path.isfile(rechunked):
+        return rechunked
+
+    # nccopy is installed with the netCDF C library
+    if shutil.which("nccopy") is None:
+        return filename
+
+    os.makedirs(output, exist_ok=True)
+
+    # write to a temporary file so a failed copy is never reused
+    temporary = f"{rechunked}.tmp"
+    process = subprocess.run(
+        [
+            "nccopy",
+            "-k", "4",
+            "-d", "1",
+            "-w",
+            "-h", "100M",
+            "-c", "nj/512,ni/512",
+            "-V", ",".join(KEEP_VARIABLES),
+            filename,
+            temporary,
+        ]
+    )
+    if process.returncode != 0:
+        print('Rechunking ' + filename + ' failed, using the downloaded file')
+        if os.path.isfile(temporary):
+            os.remove(temporary)
+        return filename
+
+    os.replace(temporary, rechunked)
+    return rechunked
+
+
 def download_data(result): 
     """
     Function to download URL data to the local folder and open the file using an xr object using results from earth access search API
@@ -167,29 +390,17 @@ def download_data(result):
     secrets = netrc.netrc()
     username, account, password = secrets.authenticators("urs.earthdata.nasa.gov")
 
-    # for each element in result, download the file and open using xarray  
-    for x in result:
-        str_result = str(x)
-        # get Data url from list
-        url = str_result.split("Data: ")[1][2:-2]
-
-        # get filename from url 
-        output = f"{os.getcwd()}/local_folder" 
-        filename = f"{output}/{url.split('/')[-1]}" 
-
-        # check if file already exists         
-        if(os.path.isfile(filename)!=True):
-            # call wget on bash using python 
-            os.system("wget " + f"-P {output}/" + " --user=" + username + " --password=" + password + " "+ url )
-        else:
-            print('Filename '+ filename + ' already exists') 
+    # download the files concurrently, as the downloads are network bound
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOADS) as pool:
+        filenames = list(pool.map(lambda x: download_file(x, username, password), result))
 
-        # test for file
+    # test for files
+    for filename in filenames:
         assert os.path.isfile(filename) == True
-        # open file using xarray
-        stream = xr.open_dataset(filename)
-        # test for stream
-        assert stream != None
 
+    # open the downloaded granule that is plotted using xarray
+    stream = open_granule(filenames)
+    # test for stream
+    assert stream != None
 
     return(stream) 
@@ -1,4 +1,3 @@
-import earthaccess
 import os 
 from oceanData import *
 
@@ -22,11 +21,7 @@ def sst(**kwargs):
         STREAM: stream data directly into dataset
     """
 
-    auth = (
-        earthaccess.login()
-    )  # Function call to retrieve credentials using the .netrc file
-
-    # Function to get data from earth access API
+    # Function to get data from earth access API, logging in on the first call
     result = get_data(**kwargs)
 
     if METHOD == "LOCAL":
@@ -38,7 +33,7 @@ def sst(**kwargs):
         stream = stream_data(result)
         assert stream != None
 
-    data_cleaned = data_cleanup(stream)
+    data_cleaned = data_cleanup(stream, kwargs.get("bounding_box"))
 
     # make directory plots if not already created
     if not os.path.exists("Plots"):
@@ -6,6 +6,7 @@ setup(
     version='1.1',
     author='Shrey Bhardwaj',
     packages=find_packages(),
+    python_requires='>=3.10',
     install_requires=[
         'earthaccess', 
         'apscheduler',